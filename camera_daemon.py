@@ -34,8 +34,9 @@ spec_takepic.loader.exec_module(takepic_module)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 TAKEPIC_SCRIPT = os.path.join(SCRIPT_DIR, "takepic.py")
 SENDER_SCRIPT = os.path.join(SCRIPT_DIR, "meshsender.py")
-IMAGE_PATH_TEMP = os.path.join(SCRIPT_DIR, "captured_image_temp.jpg")
-IMAGE_PATH = os.path.join(SCRIPT_DIR, "captured_image.webp")
+CAPTURE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else SCRIPT_DIR  # Same tmpfs location as takepic.py
+IMAGE_PATH_TEMP = os.path.join(CAPTURE_DIR, "captured_image_temp.jpg")
+IMAGE_PATH = os.path.join(CAPTURE_DIR, "captured_image.webp")
 PYTHON_BIN = sys.executable
 EXPOSURE_REFRESH_INTERVAL = 180  # Refresh exposure settings every 3 minutes
 
@@ -5,16 +5,36 @@ from PIL import Image, ImageDraw
 import sys
 import time
 import io
+import json
 import argparse
+import inspect
 import zlib
+import struct
 import os
 import threading
+import signal
+import concurrent.futures
 import http.server
-import socketserver
+import urllib.parse
+import email.utils
+
+try:
+    # python-isal wraps Intel ISA-L, whose CRC-32 folds with PCLMULQDQ.
+    # Same IEEE polynomial as zlib, so either side may lack it.
+    from isal import isal_zlib as crc_backend
+except ImportError:
+    crc_backend = zlib
+
+try:
+    import orjson  # C JSON encoder for the web endpoints
+except ImportError:
+    orjson = None
 
 # --- CONFIGURATION ---
 PORT_NUM = 256 
 CHUNK_SIZE = 200 
+# Chunk header: TransferID(4) + TotalChunks(1) + Index(1) + Compressed(1) + CRC(4) + TotalSize(4), big-endian
+CHUNK_HEADER = struct.Struct('>IBBBII')
 WEB_PORT = 5678
 GALLERY_DIR = "gallery"
 USE_WEBP = True  # WebP provides ~30% better compression than JPEG
@@ -34,107 +54,30 @@ CHUNK_OVERHEAD_BUFFER = 2  # Seconds of overhead per chunk for timeout calculati
 TIMEOUT_MULTIPLIER = 1.5  # Multiply expected duration for adaptive timeout
 MAX_RETRIES = 3  # Maximum retry attempts per chunk (was 5)
 INITIAL_RETRY_DELAY = 3  # Initial retry delay in seconds
+SEND_WINDOW = 4  # Max chunks awaiting a radio ACK before the sender blocks (0 = fixed chunk delay pacing)
+ACK_TIMEOUT = 30  # Seconds to wait for a chunk ACK before freeing its window slot
+STALE_TRANSFER_TTL = 300  # Drop incomplete transfers (and completion records) idle this long
+PROGRESS_KEEPALIVE = 15  # Seconds between /progress stream refreshes when no chunks arrive
+PROGRESS_DRAW_INTERVAL = 0.1  # Redraw the console progress bar at most this often (seconds)
+OVERLAY_LINE_HEIGHT = 12  # Pixel height of one diagnostic overlay text line
 VERBOSE = False  # Verbose logging mode
 DEBUG = False  # Debug logging mode (even more verbose)
 image_buffer = {}
 ack_messages = {}  # Store ACK messages from receivers: {sender_id: {transfer_id: [chunk_indices]}}
 completed_transfers = {}  # Track completed transfers: {sender_transfer_id: timestamp}
+gallery_cache = {'mtime': None, 'files': [], 'page': None}  # Sorted GALLERY_DIR listing, keyed on directory mtime; 'page' is (listing, rendered index)
+gallery_lock = threading.Lock()  # Protect gallery_cache
+buffer_lock = threading.RLock()  # Protect image_buffer (mesh callback vs. web server threads)
+progress_changed = threading.Condition(buffer_lock)  # Notified whenever image_buffer changes
+progress_version = 0  # Bumped with each progress_changed notification
+save_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='gallery-io')  # Disk writes off the mesh callback
 
 if not os.path.exists(GALLERY_DIR):
     os.makedirs(GALLERY_DIR)
 
-# --- WEB SERVER LOGIC ---
-class GalleryHandler(http.server.SimpleHTTPRequestHandler):
-    def log_message(self, format, *args):
-        # Suppress HTTP logs to keep console clean
-        pass
-    
-    def log_error(self, format, *args):
-        # Suppress BrokenPipeError and other client disconnects
-        if 'Broken pipe' in str(args) or 'ConnectionResetError' in str(args):
-            return
-        http.server.SimpleHTTPRequestHandler.log_error(self, format, *args)
-    
-    def do_GET(self):
-        if self.path == '/image.jpg':
-            images = sorted([f for f in os.listdir(GALLERY_DIR) if f.endswith(('.jpg', '.webp'))], reverse=True)
-            if images: self.path = f"/{GALLERY_DIR}/{images[0]}"
-            else:
-                self.send_error(404, "No images yet.")
-                return
-            return http.server.SimpleHTTPRequestHandler.do_GET(self)
-        
-        if self.path == '/progress':
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            
-            # Get current transfer status and clean up stale transfers
-            TIMEOUT_SECONDS = 60
-            progress_data = []
-            stale_senders = []
-            
-            for sender, data in image_buffer.items():
-                received = sum(1 for x in data['chunks'] if x is not None)
-                total = len(data['chunks'])
-                percent = int((received / total) * 100) if total > 0 else 0
-                elapsed = time.time() - data['start']
-                time_since_update = time.time() - data.get('last_update', data['start'])
-                bps = data['bytes'] / elapsed if elapsed > 0 else 0
-                
-                # Check for timeout
-                status = data.get('status', 'active')
-                if time_since_update > TIMEOUT_SECONDS and status == 'active':
-                    data['status'] = 'timeout'
-                    status = 'timeout'
-                    print(f"\n[X] Transfer from {sender} timed out (no data for {TIMEOUT_SECONDS}s)")
-                    show_missing_chunks(sender)  # Show which chunks are missing
-                
-                # Mark for cleanup if timed out for too long (2 minutes)
-                if time_since_update > 120:
-                    stale_senders.append(sender)
-                    continue
-                
-                progress_data.append({
-                    'sender': sender,
-                    'percent': percent,
-                    'received': received,
-                    'total': total,
-                    'bytes': data['bytes'],
-                    'total_bytes': data['total_size'],
-                    'speed': f"{bps:.1f} B/s" if status == 'active' else 'Stalled',
-                    'elapsed': f"{elapsed:.1f}s",
-                    'status': status
-                })
-            
-            # Clean up very old stale transfers
-            for sender in stale_senders:
-                del image_buffer[sender]
-            
-            import json
-            self.wfile.write(json.dumps(progress_data).encode())
-            return
-        
-        if self.path == '/api/images':
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            
-            # Get completed images
-            images = sorted([f for f in os.listdir(GALLERY_DIR) if f.endswith(('.jpg', '.webp'))], reverse=True)[:20]
-            
-            import json
-            self.wfile.write(json.dumps({'images': images}).encode())
-            return
-        
-
-        
-        if self.path == '/' or self.path == '/index.html':
-            self.send_response(200)
-            self.send_header("Content-type", "text/html")
-            self.end_headers()
-            images = sorted([f for f in os.listdir(GALLERY_DIR) if f.endswith(('.jpg', '.webp'))], reverse=True)[:20]
-            html = """
+# --- WEB GALLERY PAGE ---
+# Static parts of the index page, encoded once; only the image grid varies per request
+GALLERY_PAGE_HEAD = """
 <html>
 <head>
     <title>Mesh Gallery</title>
@@ -354,64 +297,62 @@ class GalleryHandler(http.server.SimpleHTTPRequestHandler):
         let lastImageList = '';
         let lastProgressHTML = '';
         
-        function updateProgress() {
-            fetch('/progress').then(r => r.json()).then(data => {
-                const area = document.getElementById('progress-area');
-                const container = document.getElementById('progress-container');
-                
-                if (data.length === 0) {
-                    area.classList.add('hidden');
-                    return;
-                }
+        function renderProgress(data) {
+            const area = document.getElementById('progress-area');
+            const container = document.getElementById('progress-container');
+            
+            if (data.length === 0) {
+                area.classList.add('hidden');
+                return;
+            }
+            
+            // Build new HTML  
+            const newHTML = data.map(p => {
+                const emoji = p.status === 'timeout' ? '&#9888;' : '&#128225;';
+                const timeoutClass = p.status === 'timeout' ? 'timeout' : 'pulsing';
+                const badgeClass = p.status === 'timeout' ? 'timeout' : '';
+                const timeoutLabel = p.status === 'timeout' ? '<span style="font-size:0.75rem; opacity:0.8;"> (TIMED OUT)</span>' : '';
                 
-                // Build new HTML  
-                const newHTML = data.map(p => {
-                    const emoji = p.status === 'timeout' ? '&#9888;' : '&#128225;';
-                    const timeoutClass = p.status === 'timeout' ? 'timeout' : 'pulsing';
-                    const badgeClass = p.status === 'timeout' ? 'timeout' : '';
-                    const timeoutLabel = p.status === 'timeout' ? '<span style="font-size:0.75rem; opacity:0.8;"> (TIMED OUT)</span>' : '';
-                    
-                    return `
-                    <div class="progress-item ${timeoutClass}" data-sender="${p.sender}">
-                        <div class="progress-header">
-                            <span class="sender-badge ${badgeClass}">
-                                ${emoji} ${p.sender}${timeoutLabel}
-                            </span>
+                return `
+                <div class="progress-item ${timeoutClass}" data-sender="${p.sender}">
+                    <div class="progress-header">
+                        <span class="sender-badge ${badgeClass}">
+                            ${emoji} ${p.sender}${timeoutLabel}
+                        </span>
+                    </div>
+                    <div class="progress-stats">
+                        <div class="stat-item">
+                            <span class="stat-label">Chunks:</span>
+                            <span class="stat-value">${p.received}/${p.total}</span>
+                        </div>
+                        <div class="stat-item">
+                            <span class="stat-label">Data:</span>
+                            <span class="stat-value">${(p.bytes/1024).toFixed(1)}KB/${(p.total_bytes/1024).toFixed(1)}KB</span>
                         </div>
-                        <div class="progress-stats">
-                            <div class="stat-item">
-                                <span class="stat-label">Chunks:</span>
-                                <span class="stat-value">${p.received}/${p.total}</span>
-                            </div>
-                            <div class="stat-item">
-                                <span class="stat-label">Data:</span>
-                                <span class="stat-value">${(p.bytes/1024).toFixed(1)}KB/${(p.total_bytes/1024).toFixed(1)}KB</span>
-                            </div>
-                            <div class="stat-item">
-                                <span class="stat-label">Speed:</span>
-                                <span class="stat-value">${p.speed}</span>
-                            </div>
-                            <div class="stat-item">
-                                <span class="stat-label">Time:</span>
-                                <span class="stat-value">${p.elapsed}</span>
-                            </div>
+                        <div class="stat-item">
+                            <span class="stat-label">Speed:</span>
+                            <span class="stat-value">${p.speed}</span>
                         </div>
-                        <div class="progress-bar">
-                            <div class="progress-fill" style="width: ${p.percent}%"></div>
+                        <div class="stat-item">
+                            <span class="stat-label">Time:</span>
+                            <span class="stat-value">${p.elapsed}</span>
                         </div>
-                        <div class="progress-text">${p.percent}%</div>
                     </div>
-                    `;
-                }).join('');
-                
-                // Only update if content changed to prevent flashing
-                if (newHTML !== lastProgressHTML) {
-                    container.innerHTML = newHTML;
-                    lastProgressHTML = newHTML;
-                }
-                
-                area.classList.remove('hidden');
-            });
+                    <div class="progress-bar">
+                        <div class="progress-fill" style="width: ${p.percent}%"></div>
+                    </div>
+                    <div class="progress-text">${p.percent}%</div>
+                </div>
+                `;
+            }).join('');
+            
+            // Only update if content changed to prevent flashing
+            if (newHTML !== lastProgressHTML) {
+                container.innerHTML = newHTML;
+                lastProgressHTML = newHTML;
+            }
+            
+            area.classList.remove('hidden');
         }
         
         function updateGallery() {
@@ -460,9 +401,9 @@ class GalleryHandler(http.server.SimpleHTTPRequestHandler):
             }).catch(err => console.error('Failed to update gallery:', err));
         }
         
-        setInterval(updateProgress, 1000);
+        // The server pushes progress as chunks arrive (EventSource reconnects by itself)
+        new EventSource('/progress').onmessage = e => renderProgress(JSON.parse(e.data));
         setInterval(updateGallery, 500);
-        updateProgress();
         updateGallery();
     </script>
 </head>
@@ -485,23 +426,21 @@ class GalleryHandler(http.server.SimpleHTTPRequestHandler):
             updateGallery();
         </script>
         <div id='gallery-placeholder' style='display:none;'>
-"""
-            if images:
-                html += "<div class='grid' style='display:none;'>"
-                for img in images:
-                    html += f"""
+""".encode()
+
+# One grid card per image; filled in with str.format(gallery_dir=..., img=...)
+GALLERY_CARD = """
                         <div class='card'>
-                            <a href='/{GALLERY_DIR}/{img}'>
-                                <img src='/{GALLERY_DIR}/{img}' alt='{img}'>
+                            <a href='/{gallery_dir}/{img}'>
+                                <img src='/{gallery_dir}/{img}' alt='{img}'>
                                 <div class='card-info'>
                                     <small>{img}</small>
                                 </div>
                             </a>
                         </div>
                     """
-                html += "</div>"
-            else:
-                html += """
+
+GALLERY_PAGE_EMPTY = """
                     <div class='empty-state'>
                         <svg fill='currentColor' viewBox='0 0 20 20'>
                             <path d='M4 3a2 2 0 00-2 2v10a2 2 0 002 2h12a2 2 0 002-2V5a2 2 0 00-2-2H4zm12 12H4l4-8 3 6 2-4 3 6z'/>
@@ -509,20 +448,261 @@ class GalleryHandler(http.server.SimpleHTTPRequestHandler):
                         <h3>No images yet</h3>
                         <p>Images will appear here when received via mesh</p>
                     </div>
-                """
-            html += """
+""".encode()
+
+GALLERY_PAGE_TAIL = """
         </div>
     </div>
 </body>
 </html>
-"""
-            self.wfile.write(html.encode())
+""".encode()
+
+# --- WEB SERVER LOGIC ---
+def get_gallery():
+    """Return gallery image filenames (newest name first), re-listing only when GALLERY_DIR changes"""
+    mtime = os.stat(GALLERY_DIR).st_mtime_ns
+    with gallery_lock:
+        if gallery_cache['mtime'] != mtime:
+            with os.scandir(GALLERY_DIR) as entries:
+                gallery_cache['files'] = sorted((e.name for e in entries if e.name.endswith(('.jpg', '.webp'))), reverse=True)
+            gallery_cache['mtime'] = mtime
+        return gallery_cache['files']
+
+def get_gallery_page():
+    """Return the encoded index page, re-rendering only when the gallery listing changes"""
+    images = get_gallery()
+    with gallery_lock:
+        rendered = gallery_cache['page']
+    if rendered is not None and rendered[0] is images:
+        return rendered[1]
+    recent = images[:20]
+    if recent:
+        cards = "".join(GALLERY_CARD.format(gallery_dir=GALLERY_DIR, img=img) for img in recent)
+        grid = f"<div class='grid' style='display:none;'>{cards}</div>".encode()
+    else:
+        grid = GALLERY_PAGE_EMPTY
+    page = GALLERY_PAGE_HEAD + grid + GALLERY_PAGE_TAIL
+    with gallery_lock:
+        gallery_cache['page'] = (images, page)  # Valid while get_gallery() returns this same list
+    return page
+
+def add_to_gallery(fname):
+    """Record a newly saved image in the gallery cache so the next request skips the re-list"""
+    name = os.path.basename(fname)
+    mtime = os.stat(GALLERY_DIR).st_mtime_ns
+    with gallery_lock:
+        if gallery_cache['mtime'] is None:
+            return  # Nothing cached yet; first get_gallery() will list the directory
+        if name not in gallery_cache['files']:
+            gallery_cache['files'] = sorted(gallery_cache['files'] + [name], reverse=True)
+        gallery_cache['mtime'] = mtime
+
+def save_gallery_image(data, fname):
+    """Write a received image to the gallery (runs on save_pool)"""
+    try:
+        tmp = fname + '.part'  # Renamed into place so the web server never serves a partial file
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, fname)
+        add_to_gallery(fname)
+        print(f"[+] Saved to: {fname}")
+    except Exception as e:
+        print(f"\n[X] Failed to save image {fname}: {e}")
+
+def notify_progress():
+    """Wake /progress streams after an image_buffer change (call with buffer_lock held)"""
+    global progress_version
+    progress_version += 1
+    progress_changed.notify_all()
+
+def get_progress():
+    """Snapshot active transfers for the web page, marking and cleaning up stale ones"""
+    TIMEOUT_SECONDS = 60
+    progress_data = []
+    stale_senders = []
+    
+    with buffer_lock:
+        for sender, data in image_buffer.items():
+            received = data['received']
+            total = data['total_chunks']
+            percent = int((received / total) * 100) if total > 0 else 0
+            elapsed = time.time() - data['start']
+            time_since_update = time.time() - data.get('last_update', data['start'])
+            bps = data['bytes'] / elapsed if elapsed > 0 else 0
+            
+            # Check for timeout
+            status = data.get('status', 'active')
+            if time_since_update > TIMEOUT_SECONDS and status == 'active':
+                data['status'] = 'timeout'
+                status = 'timeout'
+                print(f"\n[X] Transfer from {sender} timed out (no data for {TIMEOUT_SECONDS}s)")
+                show_missing_chunks(sender)  # Show which chunks are missing
+            
+            # Mark for cleanup if timed out for too long (2 minutes)
+            if time_since_update > 120:
+                stale_senders.append(sender)
+                continue
+            
+            progress_data.append({
+                'sender': sender,
+                'percent': percent,
+                'received': received,
+                'total': total,
+                'bytes': data['bytes'],
+                'total_bytes': data['total_size'],
+                'speed': f"{bps:.1f} B/s" if status == 'active' else 'Stalled',
+                'elapsed': f"{elapsed:.1f}s",
+                'status': status
+            })
+        
+        # Clean up very old stale transfers
+        for sender in stale_senders:
+            del image_buffer[sender]
+        
+    return progress_data
+
+class GalleryHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep-alive lets the page's /progress and /api/images polling reuse one connection;
+    # every response therefore carries a Content-Length
+    protocol_version = "HTTP/1.1"
+    timeout = 60  # Close idle keep-alive connections (and free their threads)
+    # Buffer wfile so headers and body leave in one send(); handle_one_request() flushes
+    # after each response (the base class default of 0 writes straight to the socket)
+    wbufsize = 64 * 1024
+    
+    def log_message(self, format, *args):
+        # Suppress HTTP logs to keep console clean
+        pass
+    
+    def log_error(self, format, *args):
+        # Suppress BrokenPipeError and other client disconnects
+        if 'Broken pipe' in str(args) or 'ConnectionResetError' in str(args):
+            return
+        http.server.SimpleHTTPRequestHandler.log_error(self, format, *args)
+    
+    def is_not_modified(self, etag, mtime):
+        """True if the client's conditional headers show its cached copy is current"""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                pass
+        return False
+    
+    def send_gallery_file(self, name, max_age=3600):
+        """Serve an image from GALLERY_DIR, letting the kernel copy the body (sendfile)"""
+        path = os.path.join(GALLERY_DIR, os.path.basename(name))
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            if self.is_not_modified(etag, st.st_mtime):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"public, max-age={max_age}")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-type", self.guess_type(path))
+            self.send_header("Content-Length", str(st.st_size))
+            self.send_header("Last-Modified", email.utils.formatdate(st.st_mtime, usegmt=True))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={max_age}")
+            self.end_headers()
+            self.wfile.flush()  # Headers must reach the socket before sendfile() bypasses wfile
+            # socket.sendfile() falls back to plain send() where os.sendfile is unavailable
+            self.connection.sendfile(f)
+    
+    def stream_progress(self):
+        """Server-Sent Events stream of get_progress(), pushed as transfers change"""
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.close_connection = True  # The stream only ends when the client goes away
+        
+        seen_version = None
+        last_sent = None
+        try:
+            while True:
+                with progress_changed:
+                    progress_changed.wait_for(lambda: progress_version != seen_version, timeout=PROGRESS_KEEPALIVE)
+                    seen_version = progress_version
+                    body = dump_json(get_progress())
+                # Also refreshes elapsed time and timeout status on idle wakeups
+                if body != last_sent:
+                    self.wfile.write(b"data: " + body + b"\n\n")
+                    last_sent = body
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except OSError:
+            pass  # Client disconnected (or stopped reading past the socket timeout)
+    
+    def send_json(self, obj):
+        """Send obj as a JSON response"""
+        body = dump_json(obj)
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == '/image.jpg':
+            images = get_gallery()
+            if not images:
+                self.send_error(404, "No images yet.")
+                return
+            # Latest image changes with every transfer, so browsers revalidate it every time
+            # (a 304 when it hasn't changed)
+            self.send_gallery_file(images[0], max_age=0)
+            return
+        
+        if self.path.startswith(f"/{GALLERY_DIR}/"):
+            self.send_gallery_file(urllib.parse.unquote(self.path.split('?', 1)[0]))
+            return
+        
+        if self.path == '/progress':
+            self.stream_progress()
+            return
+        
+        if self.path == '/api/images':
+            # Get completed images
+            images = get_gallery()[:20]
+            
+            self.send_json({'images': images})
+            return
+        
+
+        
+        if self.path == '/' or self.path == '/index.html':
+            body = get_gallery_page()
+            self.send_response(200)
+            self.send_header("Content-type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
             return
         return http.server.SimpleHTTPRequestHandler.do_GET(self)
 
+class GalleryServer(http.server.ThreadingHTTPServer):
+    # One thread per connection so /progress polls never queue behind image downloads
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
 def start_web_server():
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(("", WEB_PORT), GalleryHandler) as httpd:
+    with GalleryServer(("", WEB_PORT), GalleryHandler) as httpd:
         httpd.serve_forever()
 
 # --- UTILS ---
@@ -536,17 +716,30 @@ def log_debug(msg):
     if DEBUG:
         print(msg)
 
+def dump_json(obj):
+    """Serialize obj to JSON bytes, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def compute_crc32(data, value=0):
+    """CRC-32 of data (IEEE polynomial), hardware-accelerated when isal is installed"""
+    return crc_backend.crc32(data, value) & 0xFFFFFFFF
+
 def show_missing_chunks(sender):
     """Debug function to show which chunks are missing"""
-    if sender in image_buffer:
-        missing = [i for i, chunk in enumerate(image_buffer[sender]['chunks']) if chunk is None]
-        if missing:
-            total = len(image_buffer[sender]['chunks'])
-            received = total - len(missing)
-            print(f"\n[!] Transfer incomplete: {received}/{total} chunks received")
-            print(f"[!] Missing chunks: {missing[:20]}")  # Show first 20 missing
-            if len(missing) > 20:
-                print(f"[!] ... and {len(missing) - 20} more")
+    with buffer_lock:
+        transfer = image_buffer.get(sender)
+        if transfer is None:
+            return
+        missing = [i for i, got in enumerate(transfer['received_mask']) if not got]
+        total = transfer['total_chunks']
+    if missing:
+        received = total - len(missing)
+        print(f"\n[!] Transfer incomplete: {received}/{total} chunks received")
+        print(f"[!] Missing chunks: {missing[:20]}")  # Show first 20 missing
+        if len(missing) > 20:
+            print(f"[!] ... and {len(missing) - 20} more")
 
 def draw_progress_bar(current_idx, total_chunks, start_time, current_bytes, total_bytes, retries=0):
     elapsed = time.time() - start_time
@@ -561,6 +754,11 @@ def draw_progress_bar(current_idx, total_chunks, start_time, current_bytes, tota
     sys.stdout.flush()
 
 def add_diagnostic_overlay(img, stats_text, metadata=None):
+    # Encoders need RGB; converting up front (only when needed) lets us draw in place
+    # instead of copying the whole image afterwards
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    # "RGBA" draw mode alpha-blends onto the RGB image without allocating an RGBA copy
     draw = ImageDraw.Draw(img, "RGBA")
     ts = time.strftime("%m/%d/%y %H:%M")
     
@@ -573,9 +771,9 @@ def add_diagnostic_overlay(img, stats_text, metadata=None):
             lines.append(f"Exp:{metadata['exposure']:.0f}ms G:{metadata['gain']:.1f} R:{metadata.get('red_gain', 1.0):.2f} B:{metadata.get('blue_gain', 1.0):.2f}")
     
     # Calculate box dimensions
-    line_height = 12
+    line_height = OVERLAY_LINE_HEIGHT
     box_height = len(lines) * line_height + 2
-    box_width = max(len(line) * 6 for line in lines) + 6
+    box_width = int(max(draw.textlength(line) for line in lines)) + 6  # Measured with the font actually drawn
     
     # Draw background box
     draw.rectangle([0, img.height - box_height, box_width, img.height], fill=(0, 0, 0, 160))
@@ -584,7 +782,7 @@ def add_diagnostic_overlay(img, stats_text, metadata=None):
     for i, line in enumerate(lines):
         draw.text((3, img.height - box_height + 2 + i * line_height), line, fill=(255, 255, 255, 255))
     
-    return img.convert("RGB")
+    return img
 
 # --- MESH LOGIC ---
 def on_ack(packet, interface):
@@ -637,38 +835,40 @@ def check_stalled_transfers(interface):
     while True:
         time.sleep(STALL_CHECK_INTERVAL)  # Check periodically
         
-        for buffer_key in list(image_buffer.keys()):
-            if buffer_key not in image_buffer:
-                continue
+        requests = []  # (sender, REQ message), sent after releasing the lock
+        with buffer_lock:
+            for buffer_key, transfer in list(image_buffer.items()):
+                elapsed_since_update = time.time() - transfer['last_update']
                 
-            transfer = image_buffer[buffer_key]
-            elapsed_since_update = time.time() - transfer['last_update']
-            
-            # If transfer has stalled and chunks are missing, request them
-            if elapsed_since_update > STALL_REQUEST_TIMEOUT and None in transfer['chunks']:
-                missing_indices = [i for i, c in enumerate(transfer['chunks']) if c is None]
-                if missing_indices:
-                    req_msg = f"REQ:{transfer['transfer_id']:08x}:{','.join(map(str, missing_indices))}"
-                    interface.sendText(req_msg, destinationId=transfer['sender'])
-                    print(f"\n[REQ] Requesting {len(missing_indices)} missing chunks: {missing_indices[:10]}{'...' if len(missing_indices) > 10 else ''}")
-                    transfer['last_update'] = time.time()  # Reset timer
-            
-            # Adaptive timeout based on transfer size and expected completion time
-            expected_duration = len(transfer['chunks']) * (CHUNK_DELAY + CHUNK_OVERHEAD_BUFFER)  # Estimate with buffer
-            adaptive_timeout = max(TRANSFER_TIMEOUT, min(expected_duration * TIMEOUT_MULTIPLIER, 300))  # Cap at 5 minutes
-            
-            # Timeout transfer after adaptive timeout of no new data
-            if elapsed_since_update > adaptive_timeout:
-                count = sum(1 for x in transfer['chunks'] if x is not None)
-                total = len(transfer['chunks'])
-                missing = [i for i, c in enumerate(transfer['chunks']) if c is None]
+                # If transfer has stalled and chunks are missing, request them
+                if elapsed_since_update > STALL_REQUEST_TIMEOUT and transfer['received'] < transfer['total_chunks']:
+                    missing_indices = [i for i, got in enumerate(transfer['received_mask']) if not got]
+                    if missing_indices:
+                        req_msg = f"REQ:{transfer['transfer_id']:08x}:{','.join(map(str, missing_indices))}"
+                        requests.append((transfer['sender'], req_msg))
+                        print(f"\n[REQ] Requesting {len(missing_indices)} missing chunks: {missing_indices[:10]}{'...' if len(missing_indices) > 10 else ''}")
+                        transfer['last_update'] = time.time()  # Reset timer
                 
-                print(f"\n[X] Transfer from {buffer_key} timed out (no data for {adaptive_timeout:.0f}s)")
-                print(f"\n[!] Transfer incomplete: {count}/{total} chunks received")
-                if missing:
-                    print(f"[!] Missing chunks: {missing[:20]}{'...' if len(missing) > 20 else ''}")
+                # Adaptive timeout based on transfer size and expected completion time
+                expected_duration = transfer['total_chunks'] * (CHUNK_DELAY + CHUNK_OVERHEAD_BUFFER)  # Estimate with buffer
+                adaptive_timeout = max(TRANSFER_TIMEOUT, min(expected_duration * TIMEOUT_MULTIPLIER, 300))  # Cap at 5 minutes
                 
-                del image_buffer[buffer_key]
+                # Timeout transfer after adaptive timeout of no new data
+                if elapsed_since_update > adaptive_timeout:
+                    count = transfer['received']
+                    total = transfer['total_chunks']
+                    missing = [i for i, got in enumerate(transfer['received_mask']) if not got]
+                    
+                    print(f"\n[X] Transfer from {buffer_key} timed out (no data for {adaptive_timeout:.0f}s)")
+                    print(f"\n[!] Transfer incomplete: {count}/{total} chunks received")
+                    if missing:
+                        print(f"[!] Missing chunks: {missing[:20]}{'...' if len(missing) > 20 else ''}")
+                    
+                    del image_buffer[buffer_key]
+                    notify_progress()
+        
+        for sender, req_msg in requests:
+            interface.sendText(req_msg, destinationId=sender)
 
 def on_receive(packet, interface):
     try:
@@ -679,8 +879,8 @@ def on_receive(packet, interface):
                 data = decoded.get('payload')
                 
                 # Validate minimum header size
-                if len(data) < 15:
-                    print(f"\n[!] Packet too small: {len(data)} bytes (need 15)")
+                if len(data) < CHUNK_HEADER.size:
+                    print(f"\n[!] Packet too small: {len(data)} bytes (need {CHUNK_HEADER.size})")
                     return
                 
                 # Header Structure:
@@ -690,13 +890,8 @@ def on_receive(packet, interface):
                 # [6]: Compressed Flag (1 byte)
                 # [7-10]: CRC32 (4 bytes)
                 # [11-14]: Total Byte Size (4 bytes)
-                transfer_id = int.from_bytes(data[0:4], byteorder='big')
-                total_chunks = data[4]
-                chunk_index = data[5]
-                compressed_flag = data[6]
-                crc_val = int.from_bytes(data[7:11], byteorder='big')
-                reported_total_size = int.from_bytes(data[11:15], byteorder='big')
-                payload = data[15:]
+                transfer_id, total_chunks, chunk_index, compressed_flag, crc_val, reported_total_size = CHUNK_HEADER.unpack_from(data)
+                payload = memoryview(data)[CHUNK_HEADER.size:]  # Copied once, into the reassembly buffer
                 
                 # Validate parsed values
                 if total_chunks == 0 or total_chunks > 255:
@@ -709,13 +904,24 @@ def on_receive(packet, interface):
                     print(f"\n[!] Unrealistic size: {reported_total_size} bytes")
                     return
                 
+                # Chunks are reassembled in place, so the sender must split the payload the
+                # same way send_image does (CHUNK_SIZE minus the header)
+                chunk_size = CHUNK_SIZE - CHUNK_HEADER.size
+                if total_chunks != (reported_total_size + chunk_size - 1) // chunk_size:
+                    print(f"\n[!] {total_chunks} chunks doesn't match {reported_total_size} bytes at {chunk_size} bytes/chunk (CHUNK_SIZE mismatch?)")
+                    return
+                chunk_offset = chunk_index * chunk_size
+                if len(payload) != min(chunk_size, reported_total_size - chunk_offset):
+                    print(f"\n[!] Chunk {chunk_index} has unexpected length {len(payload)}")
+                    return
+                
                 sender = packet.get('fromId', 'unknown')
                 buffer_key = f"{sender}_{transfer_id}"
                 
                 # Check if this transfer was already completed (ignore retransmissions)
                 if buffer_key in completed_transfers:
                     elapsed = time.time() - completed_transfers[buffer_key]
-                    if elapsed < 300:  # Keep completed transfers for 5 minutes
+                    if elapsed < STALE_TRANSFER_TTL:  # Keep completed transfers for 5 minutes
                         # Resend OK confirmation
                         ok_msg = f"OK:{transfer_id:08x}"
                         interface.sendText(ok_msg, destinationId=sender)
@@ -724,114 +930,152 @@ def on_receive(packet, interface):
                         # Clean up old completion record
                         del completed_transfers[buffer_key]
                 
-                # Check if this is a new transfer
-                if buffer_key not in image_buffer:
-                    # Clean up old transfers from this sender
-                    old_keys = [k for k in image_buffer.keys() if k.startswith(sender + '_')]
-                    if old_keys:
-                        for old_key in old_keys:
-                            old_chunks = sum(1 for x in image_buffer[old_key]['chunks'] if x is not None)
-                            print(f"\n[!] Discarding old transfer {old_key} ({old_chunks}/{len(image_buffer[old_key]['chunks'])} chunks)")
-                            del image_buffer[old_key]
+                with buffer_lock:
+                    # Check if this is a new transfer
+                    transfer = image_buffer.get(buffer_key)
+                    if transfer is None:
+                        # Evict transfers whose sender went silent, so abandoned buffers can't
+                        # pile up (this also runs when the stall checker thread isn't)
+                        now = time.time()
+                        for key, stale in list(image_buffer.items()):
+                            if now - stale['last_update'] > STALE_TRANSFER_TTL:
+                                print(f"\n[!] Evicting stale transfer {key} ({stale['received']}/{stale['total_chunks']} chunks)")
+                                del image_buffer[key]
+                        for key, done_at in list(completed_transfers.items()):
+                            if now - done_at > STALE_TRANSFER_TTL:
+                                del completed_transfers[key]
+                        
+                        # Clean up old transfers from this sender
+                        old_keys = [k for k in image_buffer.keys() if k.startswith(sender + '_')]
+                        if old_keys:
+                            for old_key in old_keys:
+                                print(f"\n[!] Discarding old transfer {old_key} ({image_buffer[old_key]['received']}/{image_buffer[old_key]['total_chunks']} chunks)")
+                                del image_buffer[old_key]
                     
-                    image_buffer[buffer_key] = {
-                        'sender': sender,
-                        'transfer_id': transfer_id,
-                        'chunks': [None]*total_chunks, 
-                        'start': time.time(), 
-                        'last_update': time.time(),
-                        'crc': crc_val, 
-                        'bytes': 0,
-                        'total_size': reported_total_size,
-                        'status': 'active',
-                        'compressed': bool(compressed_flag)
-                    }
-                    comp_str = ' (compressed)' if compressed_flag else ''
-                    print(f"\n[!] Incoming Image from {sender} (ID: {transfer_id:08x}, {reported_total_size} bytes{comp_str})")
-                    print(f"    Total chunks: {total_chunks}")
-                    log_debug(f"[DEBUG] New transfer: buffer_key={buffer_key}, CRC={crc_val:08x}")
-                
-                # Store the chunk (allow overwrites for retransmissions)
-                if image_buffer[buffer_key]['chunks'][chunk_index] is None:
-                    print(f"  [RCV] Chunk {chunk_index}/{total_chunks-1} ({len(payload)} bytes)")
-                    image_buffer[buffer_key]['bytes'] += len(payload)
-                    log_verbose(f"[VERBOSE] New chunk received: index={chunk_index}, size={len(payload)}")
-                else:
-                    print(f"  [RETRY] Chunk {chunk_index}/{total_chunks-1} ({len(payload)} bytes)")
-                    log_verbose(f"[VERBOSE] Duplicate chunk (retransmission): index={chunk_index}")
+                        transfer = image_buffer[buffer_key] = {
+                            'sender': sender,
+                            'transfer_id': transfer_id,
+                            'data': bytearray(reported_total_size),  # Chunks are written at their offsets
+                            'received_mask': bytearray(total_chunks),  # 1 per chunk index once stored
+                            'total_chunks': total_chunks,
+                            'received': 0,  # Count of set entries in 'received_mask'
+                            'crc_running': 0,  # CRC32 of chunks[0:crc_next], folded in as they arrive
+                            'crc_next': 0,  # Next chunk index to fold into crc_running
+                            'start': time.time(), 
+                            'last_update': time.time(),
+                            'last_draw': 0.0,  # time.monotonic() of the last progress bar redraw
+                            'crc': crc_val, 
+                            'bytes': 0,
+                            'total_size': reported_total_size,
+                            'status': 'active',
+                            'compressed': bool(compressed_flag)
+                        }
+                        comp_str = ' (compressed)' if compressed_flag else ''
+                        print(f"\n[!] Incoming Image from {sender} (ID: {transfer_id:08x}, {reported_total_size} bytes{comp_str})")
+                        print(f"    Total chunks: {total_chunks}")
+                        log_debug(f"[DEBUG] New transfer: buffer_key={buffer_key}, CRC={crc_val:08x}")
+                    
+                    # Store the chunk (retransmissions keep the first copy, which may already be in the CRC)
+                    mask = transfer['received_mask']
+                    if not mask[chunk_index]:
+                        print(f"  [RCV] Chunk {chunk_index}/{total_chunks-1} ({len(payload)} bytes)")
+                        transfer['data'][chunk_offset:chunk_offset + len(payload)] = payload
+                        mask[chunk_index] = 1
+                        transfer['received'] += 1
+                        transfer['bytes'] += len(payload)
+                        log_verbose(f"[VERBOSE] New chunk received: index={chunk_index}, size={len(payload)}")
+                        
+                        # Fold the in-order prefix into the running CRC; an out-of-order
+                        # chunk waits in its slot until the gap before it fills
+                        crc_start = crc_end = transfer['crc_next']
+                        while crc_end < total_chunks and mask[crc_end]:
+                            crc_end += 1
+                        if crc_end > crc_start:
+                            span = memoryview(transfer['data'])[crc_start * chunk_size:crc_end * chunk_size]
+                            transfer['crc_running'] = compute_crc32(span, transfer['crc_running'])
+                            span.release()
+                            transfer['crc_next'] = crc_end
+                    else:
+                        print(f"  [RETRY] Chunk {chunk_index}/{total_chunks-1} ({len(payload)} bytes)")
+                        log_verbose(f"[VERBOSE] Duplicate chunk (retransmission): index={chunk_index}")
+                    
+                    transfer['last_update'] = time.time()
+                    transfer['status'] = 'active'
+                    
+                    count = transfer['received']
+                    notify_progress()
+                    now = time.monotonic()  # Immune to wall-clock (NTP) jumps
+                    if now - transfer['last_draw'] >= PROGRESS_DRAW_INTERVAL or count == total_chunks:
+                        draw_progress_bar(count, total_chunks, transfer['start'], transfer['bytes'], transfer['total_size'])
+                        transfer['last_draw'] = now
+                    
+                    # Check if transfer appears complete (or stalled)
+                    elapsed_since_update = time.time() - transfer['last_update']
+                    
+                    # If we haven't received a chunk in the stall timeout and some are missing, request them
+                    if elapsed_since_update > STALL_REQUEST_TIMEOUT and count < total_chunks:
+                        missing_indices = [i for i, got in enumerate(mask) if not got]
+                        if missing_indices:
+                            req_msg = f"REQ:{transfer_id:08x}:{','.join(map(str, missing_indices))}"
+                            interface.sendText(req_msg, destinationId=sender)
+                            print(f"\n[REQ] Requesting {len(missing_indices)} missing chunks: {missing_indices[:10]}{'...' if len(missing_indices) > 10 else ''}")
+                            transfer['last_update'] = time.time()  # Reset timer
+                    
+                    if count < total_chunks:
+                        return
+                    
+                    # Transfer complete: take it out of the shared buffer before reassembly
+                    del image_buffer[buffer_key]
+                    notify_progress()
                 
-                image_buffer[buffer_key]['chunks'][chunk_index] = payload
-                image_buffer[buffer_key]['last_update'] = time.time()
-                image_buffer[buffer_key]['status'] = 'active'
+                print(f"\n[+] All {total_chunks} chunks received!")
                 
-                count = sum(1 for x in image_buffer[buffer_key]['chunks'] if x is not None)
-                draw_progress_bar(count, total_chunks, image_buffer[buffer_key]['start'], image_buffer[buffer_key]['bytes'], image_buffer[buffer_key]['total_size'])
-
-                # Check if transfer appears complete (or stalled)
-                elapsed_since_update = time.time() - image_buffer[buffer_key]['last_update']
+                # Verify CRC (accumulated per chunk) BEFORE decompressing
+                if transfer['crc_running'] != transfer['crc']:
+                    print(f"\n[X] CRC mismatch! Image corrupted.")
+                    return
+                full = transfer['data']
                 
-                # If we haven't received a chunk in the stall timeout and some are missing, request them
-                if elapsed_since_update > STALL_REQUEST_TIMEOUT and None in image_buffer[buffer_key]['chunks']:
-                    missing_indices = [i for i, c in enumerate(image_buffer[buffer_key]['chunks']) if c is None]
-                    if missing_indices:
-                        req_msg = f"REQ:{transfer_id:08x}:{','.join(map(str, missing_indices))}"
-                        interface.sendText(req_msg, destinationId=sender)
-                        print(f"\n[REQ] Requesting {len(missing_indices)} missing chunks: {missing_indices[:10]}{'...' if len(missing_indices) > 10 else ''}")
-                        image_buffer[buffer_key]['last_update'] = time.time()  # Reset timer
-
-                if None not in image_buffer[buffer_key]['chunks']:
-                    print(f"\n[+] All {total_chunks} chunks received!")
-                    full = b"".join(image_buffer[buffer_key]['chunks'])
-                    
-                    # Verify CRC on assembled chunks BEFORE decompressing
-                    if zlib.crc32(full) & 0xFFFFFFFF != image_buffer[buffer_key]['crc']:
-                        print(f"\n[X] CRC mismatch! Image corrupted.")
-                        del image_buffer[buffer_key]
+                # Decompress if needed (AFTER CRC check)
+                if transfer.get('compressed', False):
+                    try:
+                        full = zlib.decompress(full)
+                        print(f"\n[+] Decompressed payload")
+                    except Exception as e:
+                        print(f"\n[X] Decompression failed: {e}")
                         return
+                
+                try:
+                    img = Image.open(io.BytesIO(full))
                     
-                    # Decompress if needed (AFTER CRC check)
-                    if image_buffer[buffer_key].get('compressed', False):
-                        try:
-                            full = zlib.decompress(full)
-                            print(f"\n[+] Decompressed payload")
-                        except Exception as e:
-                            print(f"\n[X] Decompression failed: {e}")
-                            del image_buffer[buffer_key]
-                            return
+                    # Detect format and save accordingly
+                    img_format = img.format if img.format else 'JPEG'
+                    ext = 'webp' if img_format == 'WEBP' else 'jpg'
+                    # Use transfer_id in filename to support multiple concurrent transfers
+                    sender_short = sender.replace('!', '')[-6:] if sender else 'unknown'
+                    fname = f"{GALLERY_DIR}/img_{sender_short}_{transfer_id:08x}.{ext}"
+                    # The payload is already an encoded image; write it as-is in the background
+                    save_pool.submit(save_gallery_image, full, fname)
+                    duration = time.time() - transfer['start']
+                    print(f"\n[SUCCESS] {len(full)} bytes in {duration:.1f}s")
                     
-                    try:
-                        img = Image.open(io.BytesIO(full))
-                        
-                        # Detect format and save accordingly
-                        img_format = img.format if img.format else 'JPEG'
-                        ext = 'webp' if img_format == 'WEBP' else 'jpg'
-                        # Use transfer_id in filename to support multiple concurrent transfers
-                        sender_short = sender.replace('!', '')[-6:] if sender else 'unknown'
-                        fname = f"{GALLERY_DIR}/img_{sender_short}_{transfer_id:08x}.{ext}"
-                        img.save(fname)
-                        duration = time.time() - image_buffer[buffer_key]['start']
-                        print(f"\n[SUCCESS] {len(full)} bytes in {duration:.1f}s")
-                        print(f"[+] Saved to: {fname}")
-                        
-                        # Mark as completed
-                        completed_transfers[buffer_key] = time.time()
-                        
-                        # Send OK confirmation to sender (multiple times for reliability)
-                        ok_msg = f"OK:{transfer_id:08x}"
-                        for _ in range(3):
-                            interface.sendText(ok_msg, destinationId=sender)
-                            time.sleep(0.5)
-                        print(f"[+] Sent OK confirmation to {sender} (3x)")
-                    except Exception as e:
-                        print(f"\n[X] Failed to save image: {e}")
-                        import traceback
-                        traceback.print_exc()
+                    # Mark as completed
+                    completed_transfers[buffer_key] = time.time()
                     
-                    del image_buffer[buffer_key]
+                    # Send OK confirmation to sender (multiple times for reliability)
+                    ok_msg = f"OK:{transfer_id:08x}"
+                    for _ in range(3):
+                        interface.sendText(ok_msg, destinationId=sender)
+                        time.sleep(0.5)
+                    print(f"[+] Sent OK confirmation to {sender} (3x)")
+                except Exception as e:
+                    print(f"\n[X] Failed to process image: {e}")
+                    import traceback
+                    traceback.print_exc()
     except Exception as e:
         print(f"\n[!] Receive error: {e}")
 
-def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_delay=None):
+def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_delay=None, window=None):
     """
     Send an image over the mesh network
     
@@ -843,10 +1087,13 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
         qual: Image quality
         metadata: Optional metadata dict
         chunk_delay: Delay between chunks in seconds (uses CHUNK_DELAY if None)
+        window: Max chunks awaiting ACK (uses SEND_WINDOW if None, 0 = fixed chunk_delay pacing)
     """
     # Use provided chunk_delay or fall back to global CHUNK_DELAY
     if chunk_delay is None:
         chunk_delay = CHUNK_DELAY
+    if window is None:
+        window = SEND_WINDOW
     
     # Validate chunk delay
     chunk_delay = max(MIN_CHUNK_DELAY, min(MAX_CHUNK_DELAY, chunk_delay))
@@ -862,41 +1109,32 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
         # Determine best format
         use_webp = USE_WEBP
         
+        # Draw the overlay first so each candidate format is encoded exactly once;
+        # the encoded size and format are reported on the console instead
+        stats_info = f"{res}px {qual}Q"
+        img = add_diagnostic_overlay(img, stats_info, metadata)
+        
         # Save to JPEG first
         tmp_jpeg = io.BytesIO()
         img.save(tmp_jpeg, format='JPEG', quality=qual, optimize=True, progressive=True)
-        jpeg_size = len(tmp_jpeg.getvalue())
+        data = tmp_jpeg.getvalue()
+        jpeg_size = len(data)
+        format_name = 'JPEG'
         
         # Only try WebP if enabled and likely to be beneficial
         if use_webp:
             tmp_webp = io.BytesIO()
             img.save(tmp_webp, format='WEBP', quality=qual, method=6)  # method=6 is slower but better compression
-            webp_size = len(tmp_webp.getvalue())
+            webp_size = tmp_webp.tell()
             
             if webp_size < jpeg_size:
                 format_name = 'WEBP'
-                size_kb = webp_size / 1024
+                data = tmp_webp.getvalue()
                 print(f"[+] WebP is {((jpeg_size-webp_size)/jpeg_size*100):.1f}% smaller than JPEG")
             else:
-                format_name = 'JPEG'
-                size_kb = jpeg_size / 1024
-                use_webp = False
                 print(f"[*] JPEG is smaller, using JPEG")
-        else:
-            format_name = 'JPEG'
-            size_kb = jpeg_size / 1024
         
-        stats_info = f"{res}px {qual}Q {size_kb:.1f}KB {format_name}"
-        img = add_diagnostic_overlay(img, stats_info, metadata)
-        
-        # Save final image with optimizations
-        buf = io.BytesIO()
-        if use_webp:
-            img.save(buf, format='WEBP', quality=qual, method=6)
-        else:
-            img.save(buf, format='JPEG', quality=qual, optimize=True, progressive=True)
-        
-        data = buf.getvalue()
+        print(f"[*] Encoded {format_name}: {len(data) / 1024:.1f}KB")
         total_size = len(data)
         
         # Generate unique transfer ID
@@ -906,7 +1144,7 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
         print(f"[*] Transfer ID: {transfer_id:08x}")
         print(f"[*] TOTAL PAYLOAD: {total_size} bytes")
         
-        crc_val = zlib.crc32(data) & 0xFFFFFFFF
+        crc_val = compute_crc32(data)
         print(f"[*] CRC: {crc_val:08x}")
         
         # Try compressing the entire payload
@@ -920,53 +1158,102 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
                 data = compressed_data
                 total_size = len(compressed_data)
                 # Recalculate CRC for compressed data
-                crc_val = zlib.crc32(data) & 0xFFFFFFFF
+                crc_val = compute_crc32(data)
                 print(f"[+] New CRC after compression: {crc_val:08x}")
             else:
                 print(f"[-] Compression not beneficial ({len(compressed_data)} >= {total_size * 0.95:.0f}), skipping")
                 compressed_data = None
         
         # Adjust actual_chunk to account for the header (15 bytes: transfer_id(4) + metadata(11))
-        actual_chunk = CHUNK_SIZE - 15
-        chunks = [data[i:i + actual_chunk] for i in range(0, total_size, actual_chunk)]
+        actual_chunk = CHUNK_SIZE - CHUNK_HEADER.size
+        n_chunks = (total_size + actual_chunk - 1) // actual_chunk
+        payload = memoryview(data)  # Chunks are zero-copy slices; header + slice is the only copy
         
-        print(f"[*] Creating {len(chunks)} chunks of {actual_chunk} bytes each")
+        print(f"[*] Creating {n_chunks} chunks of {actual_chunk} bytes each")
         print(f"[*] Total data to send: {total_size} bytes")
         
+        compressed_flag = 1 if compressed_data else 0
+        
         start_time = time.time()
         total_retries = 0
         failed_chunks = 0
         successful_chunks = 0
         ack_received = set()  # Track which chunks have been acknowledged
         
+        sent_bytes = 0  # Payload bytes sent so far (matching how receiver counts)
+        last_draw = 0.0  # time.monotonic() of the last progress bar redraw
+        
         # Adaptive delay tracking
         current_delay = chunk_delay
+        
+        # Sliding window: up to `window` chunks await their radio ACK at once, and each
+        # ACK (or NAK, or ACK_TIMEOUT) frees a slot, so pacing follows the link instead
+        # of a fixed sleep. Older meshtastic releases can't pass ACKs to a callback.
+        ack_clocked = window > 0 and 'onResponseAckPermitted' in inspect.signature(interface.sendData).parameters
+        window_slots = threading.Semaphore(max(window, 1))
+        in_flight = {}  # chunk index -> send time, for chunks awaiting an ACK
+        in_flight_lock = threading.Lock()
+        
+        def on_chunk_response(idx, packet):
+            # Runs on the meshtastic reader thread with the routing ACK/NAK for chunk idx
+            with in_flight_lock:
+                if in_flight.pop(idx, None) is None:
+                    return  # Slot was already reclaimed by the timeout
+                if packet.get('decoded', {}).get('routing', {}).get('errorReason', 'NONE') == 'NONE':
+                    ack_received.add(idx)
+            window_slots.release()
+        
+        if ack_clocked:
+            log_verbose(f"[VERBOSE] ACK-clocked sending, window={window}")
 
-        for i, chunk in enumerate(chunks):
-            # Construct Header: TransferID(4) + TotalChunks(1) + Index(1) + Compressed(1) + CRC(4) + TotalSize(4)
-            compressed_flag = 1 if compressed_data else 0
-            header = transfer_id.to_bytes(4, 'big') + bytes([len(chunks), i, compressed_flag]) + crc_val.to_bytes(4, 'big') + total_size.to_bytes(4, 'big')
+        for i in range(n_chunks):
+            chunk = payload[i * actual_chunk:(i + 1) * actual_chunk]
+            header = CHUNK_HEADER.pack(transfer_id, n_chunks, i, compressed_flag, crc_val, total_size)
             p_data = header + chunk
             
-            log_debug(f"[DEBUG] Sending chunk {i+1}/{len(chunks)}: header={len(header)}B, payload={len(chunk)}B, total={len(p_data)}B")
+            log_debug(f"[DEBUG] Sending chunk {i+1}/{n_chunks}: header={len(header)}B, payload={len(chunk)}B, total={len(p_data)}B")
+            
+            if ack_clocked:
+                # Block until a slot frees; reclaim slots whose ACK never arrived
+                # (the receiver will REQ those chunks later)
+                while not window_slots.acquire(timeout=1):
+                    now = time.time()
+                    with in_flight_lock:
+                        expired = [idx for idx, sent_at in in_flight.items() if now - sent_at > ACK_TIMEOUT]
+                        for idx in expired:
+                            del in_flight[idx]
+                    for idx in expired:
+                        log_verbose(f"[VERBOSE] No ACK for chunk {idx+1}/{n_chunks} after {ACK_TIMEOUT}s")
+                        window_slots.release()
             
             success = False
             retry_count = 0
             max_retries = MAX_RETRIES
+            send_started = time.monotonic()
             
             while not success and retry_count < max_retries:
                 try:
-                    interface.sendData(p_data, destinationId=target_id, portNum=PORT_NUM, wantAck=True)
+                    if ack_clocked:
+                        with in_flight_lock:
+                            in_flight[i] = time.time()
+                        interface.sendData(p_data, destinationId=target_id, portNum=PORT_NUM, wantAck=True,
+                                           onResponse=lambda packet, idx=i: on_chunk_response(idx, packet),
+                                           onResponseAckPermitted=True)
+                    else:
+                        interface.sendData(p_data, destinationId=target_id, portNum=PORT_NUM, wantAck=True)
                     success = True
                     successful_chunks += 1
-                    log_verbose(f"[VERBOSE] Chunk {i+1}/{len(chunks)} sent successfully")
+                    log_verbose(f"[VERBOSE] Chunk {i+1}/{n_chunks} sent successfully")
                 except Exception as e:
+                    if ack_clocked:
+                        with in_flight_lock:
+                            in_flight.pop(i, None)  # No response will come; keep the slot for the retry
                     retry_count += 1
                     total_retries += 1
                     failed_chunks += 1
                     # Exponential backoff: 3s, 6s, 12s
                     retry_delay = INITIAL_RETRY_DELAY * (2 ** (retry_count - 1))
-                    print(f"\n[!] Chunk {i+1}/{len(chunks)} failed (attempt {retry_count}/{max_retries}): {e}")
+                    print(f"\n[!] Chunk {i+1}/{n_chunks} failed (attempt {retry_count}/{max_retries}): {e}")
                     if retry_count < max_retries:
                         print(f"[*] Retrying in {retry_delay}s...")
                         time.sleep(retry_delay)
@@ -975,9 +1262,11 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
                 print(f"\n[X] Failed to send chunk {i+1} after {max_retries} attempts. Aborting.")
                 return
 
-            # Track actual payload bytes sent (matching how receiver counts)
-            sent_bytes = sum(len(c) for c in chunks[:i+1])
-            draw_progress_bar(i+1, len(chunks), start_time, sent_bytes, total_size, total_retries)
+            sent_bytes += len(chunk)
+            now = time.monotonic()
+            if now - last_draw >= PROGRESS_DRAW_INTERVAL or i == n_chunks - 1:
+                draw_progress_bar(i+1, n_chunks, start_time, sent_bytes, total_size, total_retries)
+                last_draw = now
             
             # Adaptive delay based on success rate (if enabled)
             if ADAPTIVE_DELAY and i > 0:
@@ -991,9 +1280,16 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
                 if abs(current_delay - old_delay) > 0.01:
                     log_verbose(f"[VERBOSE] Adaptive delay adjusted: {old_delay:.2f}s -> {current_delay:.2f}s (success rate: {success_rate:.1%})")
             
-            log_debug(f"[DEBUG] Waiting {current_delay:.2f}s before next chunk")
-            time.sleep(current_delay)
-        
+            if not ack_clocked:
+                # The gap runs from the start of this send, so time spent in sendData
+                # (a busy radio queue) or retry backoff counts towards it
+                gap = current_delay - (time.monotonic() - send_started)
+                if gap > 0:
+                    log_debug(f"[DEBUG] Waiting {gap:.2f}s before next chunk")
+                    time.sleep(gap)
+        
+        if ack_clocked:
+            log_verbose(f"[VERBOSE] {len(ack_received)}/{n_chunks} chunks ACKed by the mesh so far")
         print(f"\n[*] Initial send complete. Waiting for receiver...")
         
         # Wait for receiver to request missing chunks or send OK
@@ -1019,22 +1315,20 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
                     print(f"\n[*] Sending {len(requested_chunks)} requested chunks: {requested_chunks[:10]}{'...' if len(requested_chunks) > 10 else ''}")
                     
                     for chunk_idx in requested_chunks:
-                        if chunk_idx >= len(chunks):
+                        if chunk_idx >= n_chunks:
                             continue
                         
-                        chunk = chunks[chunk_idx]
-                        compressed_flag = 1 if compressed_data else 0
-                        header = transfer_id.to_bytes(4, 'big') + bytes([len(chunks), chunk_idx, compressed_flag]) + crc_val.to_bytes(4, 'big') + total_size.to_bytes(4, 'big')
-                        p_data = header + chunk
+                        chunk = payload[chunk_idx * actual_chunk:(chunk_idx + 1) * actual_chunk]
+                        p_data = CHUNK_HEADER.pack(transfer_id, n_chunks, chunk_idx, compressed_flag, crc_val, total_size) + chunk
                         
                         try:
                             interface.sendData(p_data, destinationId=target_id, portNum=PORT_NUM, wantAck=True)
                             total_retries += 1
-                            print(f"  [RETRY] Sent chunk {chunk_idx}/{len(chunks)-1}")
+                            print(f"  [RETRY] Sent chunk {chunk_idx}/{n_chunks-1}")
                         except Exception as e:
                             print(f"  [!] Failed to resend chunk {chunk_idx}: {e}")
                         
-                        time.sleep(CHUNK_DELAY)
+                        time.sleep(current_delay)
                     
                     # Clear the REQ so we don't process it again
                     del ack_messages[target_id][transfer_id]
@@ -1049,7 +1343,7 @@ def send_image(interface, target_id, file_path, res, qual, metadata=None, chunk_
         duration = time.time() - start_time
         avg_speed = total_size / duration
         print(f"\n\n--- TRANSFER SUMMARY ---")
-        print(f"Chunks Sent: {len(chunks)}")
+        print(f"Chunks Sent: {n_chunks}")
         print(f"Final Size: {total_size} bytes")
         print(f"Time Taken: {duration:.1f} seconds")
         print(f"Avg Speed : {avg_speed:.2f} B/s")
@@ -1074,6 +1368,8 @@ def main():
     parser.add_argument("--port", help="Serial port (e.g., /dev/ttyUSB0)")
     parser.add_argument("--chunk-delay", type=float, default=CHUNK_DELAY, 
                         help=f"Delay between chunks in seconds (default: {CHUNK_DELAY}, range: {MIN_CHUNK_DELAY}-{MAX_CHUNK_DELAY})")
+    parser.add_argument("--window", type=int, default=SEND_WINDOW,
+                        help=f"Max chunks awaiting ACK before pausing (default: {SEND_WINDOW}, 0 = fixed --chunk-delay pacing)")
     parser.add_argument("--no-adaptive", action="store_true", 
                         help="Disable adaptive chunk delay adjustment")
     parser.add_argument("--fast", action="store_true",
@@ -1119,7 +1415,14 @@ def main():
             threading.Thread(target=check_stalled_transfers, args=(iface,), daemon=True).start()
             pub.subscribe(on_receive, "meshtastic.receive")
             print(f"[*] Receiver Active. Web Port: {WEB_PORT}")
-            while True: time.sleep(1)
+            # Sleep until Ctrl+C / SIGTERM instead of waking every second
+            stop = threading.Event()
+            signal.signal(signal.SIGINT, lambda *_: stop.set())
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            stop.wait()
+            print("\n[*] Shutting down receiver...")
+            save_pool.shutdown(wait=True)  # Finish writing any received images
+            iface.close()
         elif args.mode == "send":
             # Subscribe to receive ACK messages
             pub.subscribe(on_ack, "meshtastic.receive")
@@ -1129,12 +1432,11 @@ def main():
             metadata_file = args.file + '.meta'
             if os.path.exists(metadata_file):
                 try:
-                    import json
                     with open(metadata_file, 'r') as f:
                         metadata = json.load(f)
                 except Exception:
                     pass
-            send_image(iface, args.target, args.file, args.res, args.qual, metadata, chunk_delay=args.chunk_delay)
+            send_image(iface, args.target, args.file, args.res, args.qual, metadata, chunk_delay=args.chunk_delay, window=args.window)
     except Exception as e:
         print(f"[X] Connection Error: {e}")
         sys.exit(1)
@@ -1,50 +1,53 @@
 import time
-import subprocess
-import sys
 import os
 import argparse
-import numpy as np
 import cv2
 from picamera2 import Picamera2
 
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Capture files are rewritten every shot: keep them in RAM (tmpfs) when available to spare the SD card
+CAPTURE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else SCRIPT_DIR
+
 # Relative paths (can be customized as needed)
-IMAGE_PATH_TEMP = os.path.join(SCRIPT_DIR, "captured_image_temp.jpg")  # Temporary capture
-IMAGE_PATH = os.path.join(SCRIPT_DIR, "captured_image.webp")  # Final WebP
+IMAGE_PATH = os.path.join(CAPTURE_DIR, "captured_image.webp")  # Final WebP
 SENDER_SCRIPT = os.path.join(SCRIPT_DIR, "meshsender.py")
 
-# Use the current Python interpreter
-PYTHON_BIN = sys.executable
+# Exposure decisions only need coarse statistics: analyze every Nth row/column of the preview
+PREVIEW_ANALYSIS_STEP = 4
+
+# After changing controls, wait for frames that report them applied (within tolerance), up to a timeout
+SETTLE_TOLERANCE = 0.05
+SETTLE_TIMEOUT = 0.5
 
 def analyze_image_quality(image):
     """
     Analyze image for over-exposure and color balance issues.
     Returns: dict with metrics and recommended color gains
     """
-    # Split into RGB channels
-    b, g, r = cv2.split(image)
+    # Counts below are per channel value, so view the image as one channel (H x W*3)
+    values = image.reshape(image.shape[0], -1)
     
     # 1. Over-exposure detection (check for blown highlights)
-    overexposed_pixels = np.sum(image > 240)  # Pixels near white
+    overexposed_pixels = cv2.countNonZero(cv2.compare(values, 240, cv2.CMP_GT))  # Pixels near white
     total_pixels = image.size
     overexposure_pct = (overexposed_pixels / total_pixels) * 100
     
     # 2. Under-exposure detection (check for crushed shadows)
-    underexposed_pixels = np.sum(image < 15)  # Pixels near black
+    underexposed_pixels = cv2.countNonZero(cv2.compare(values, 15, cv2.CMP_LT))  # Pixels near black
     underexposure_pct = (underexposed_pixels / total_pixels) * 100
     
-    # 3. Color balance analysis
-    mean_r = np.mean(r)
-    mean_g = np.mean(g)
-    mean_b = np.mean(b)
+    # 3. Color balance analysis (one cv2.mean pass gives every channel; frames are BGR)
+    mean_b, mean_g, mean_r = cv2.mean(image)[:3]
     
     # Calculate color cast (deviation from neutral gray)
     avg = (mean_r + mean_g + mean_b) / 3
-    r_ratio = mean_r / avg if avg > 0 else 1.0
-    g_ratio = mean_g / avg if avg > 0 else 1.0
-    b_ratio = mean_b / avg if avg > 0 else 1.0
+    if avg > 0:
+        inv_avg = 1.0 / avg
+        r_ratio, g_ratio, b_ratio = mean_r * inv_avg, mean_g * inv_avg, mean_b * inv_avg
+    else:
+        r_ratio = g_ratio = b_ratio = 1.0
     
     # 4. Determine color cast type
     color_cast = "neutral"
@@ -67,8 +70,8 @@ def analyze_image_quality(image):
         recommended_blue_gain = recommended_blue_gain * g_ratio
     
     # Clamp gains to reasonable values
-    recommended_red_gain = np.clip(recommended_red_gain, 0.5, 2.5)
-    recommended_blue_gain = np.clip(recommended_blue_gain, 0.5, 2.5)
+    recommended_red_gain = max(0.5, min(2.5, recommended_red_gain))
+    recommended_blue_gain = max(0.5, min(2.5, recommended_blue_gain))
     
     return {
         'overexposure_pct': overexposure_pct,
@@ -82,6 +85,16 @@ def analyze_image_quality(image):
         'recommended_blue_gain': recommended_blue_gain
     }
 
+def wait_for_controls(picam2, exposure, gain, timeout=SETTLE_TIMEOUT):
+    """Poll frame metadata until the requested exposure and gain are in effect"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        md = picam2.capture_metadata()
+        if (abs(md.get('ExposureTime', 0) - exposure) <= exposure * SETTLE_TOLERANCE and
+                abs(md.get('AnalogueGain', 0) - gain) <= gain * SETTLE_TOLERANCE):
+            return True
+    return False
+
 def auto_adjust_exposure(picam2, target_brightness=90, max_iterations=5):
     """
     Automatically adjust exposure, gain, and color balance based on preview images.
@@ -104,13 +117,27 @@ def auto_adjust_exposure(picam2, target_brightness=90, max_iterations=5):
             "AeEnable": False
         })
         
-        time.sleep(0.5)  # Let camera adjust
+        wait_for_controls(picam2, exposure, gain)  # Let camera adjust
         
         # Capture preview
         preview = picam2.capture_array()
         
-        # Analyze image quality
-        analysis = analyze_image_quality(preview)
+        # Analyze image quality (on a decimated view; 640x480 -> 160x120)
+        small = preview[::PREVIEW_ANALYSIS_STEP, ::PREVIEW_ANALYSIS_STEP]
+        
+        # Blown sky fills the top of the frame: if the top strip alone holds over 5% of all
+        # values (not just its own), the full over-exposure check is certain to trip as well
+        strip = small[:max(1, small.shape[0] // 10)]
+        strip_overexposed = cv2.countNonZero(cv2.compare(strip.reshape(strip.shape[0], -1), 240, cv2.CMP_GT))
+        if (strip_overexposed / small.size) * 100 > 5.0:
+            print(f"  Iteration {i+1}:")
+            print(f"    Exposure: {exposure/1000:.1f}ms, Gain: {gain:.1f}")
+            print(f"    WARNING: Over-exposure detected in top of frame! Reducing exposure...")
+            exposure = int(exposure * 0.6)
+            gain = max(1.0, gain * 0.8)
+            continue
+        
+        analysis = analyze_image_quality(small)
         
         print(f"  Iteration {i+1}:")
         print(f"    Brightness: {analysis['mean_brightness']:.1f}/255")
@@ -218,20 +245,15 @@ def capture_night_image(use_cached_settings=False):
     time.sleep(1.5)
     
     print("[*] Capturing final image...")
-    picam2.capture_file(IMAGE_PATH_TEMP)  # Capture as JPEG first
+    frame = picam2.capture_array()  # Raw BGR pixels; encoded once, straight to WebP
     picam2.stop()
-    print(f"[+] Image captured to {IMAGE_PATH_TEMP}")
+    print(f"[+] Image captured: {frame.shape[1]}x{frame.shape[0]}")
     
-    # Convert to WebP for sending
-    print("[*] Converting to WebP...")
+    # Encode WebP for sending
+    print("[*] Encoding WebP...")
     try:
-        from PIL import Image
-        # Open the captured JPEG
-        img = Image.open(IMAGE_PATH_TEMP)
-        print(f"[+] Opened captured image: {img.size} {img.format}")
-        
-        # Convert to WebP for sending
-        img.save(IMAGE_PATH, format='WEBP', quality=80)
+        if not cv2.imwrite(IMAGE_PATH, frame, [cv2.IMWRITE_WEBP_QUALITY, 80]):
+            raise RuntimeError("OpenCV could not write WebP")
         print(f"[+] WebP image saved to {IMAGE_PATH}")
         print(f"    WebP file size: {os.path.getsize(IMAGE_PATH)} bytes")
     except Exception as e:
@@ -262,14 +284,35 @@ def send_to_mesh(target_node, res, qual):
         file_size = os.path.getsize(IMAGE_PATH)
         print(f"[*] Sending image ({res}px @ Q{qual}) - source file: {file_size} bytes")
         print(f"    Note: Image will be resized during transfer (final payload will be smaller)")
-        cmd = [
-            PYTHON_BIN, SENDER_SCRIPT, "send", 
-            target_node, IMAGE_PATH, 
-            "--res", res, "--qual", qual
-        ]
-        print(f"    Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=False)
-        if result.returncode == 0:
+        
+        # Run meshsender in-process rather than starting a second interpreter (and
+        # re-importing meshtastic) per capture; loaded by path since the meshsender/
+        # package directory shadows meshsender.py for a plain import
+        import importlib.util
+        import json
+        import meshtastic.serial_interface
+        from pubsub import pub
+        spec = importlib.util.spec_from_file_location("meshsender_module", SENDER_SCRIPT)
+        meshsender = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(meshsender)
+        
+        metadata = None
+        metadata_file = IMAGE_PATH + '.meta'
+        if os.path.exists(metadata_file):
+            try:
+                with open(metadata_file, 'r') as f:
+                    metadata = json.load(f)
+            except Exception:
+                pass
+        
+        iface = meshtastic.serial_interface.SerialInterface(connectNow=True)
+        pub.subscribe(meshsender.on_ack, "meshtastic.receive")
+        try:
+            success = meshsender.send_image(iface, target_node, IMAGE_PATH, int(res), int(qual), metadata)
+        finally:
+            pub.unsubscribe(meshsender.on_ack, "meshtastic.receive")
+            iface.close()
+        if success:
             print("[+] Image transmission finished successfully.")
         else:
             print("[X] Error: Image transmission failed.")